@@ -1086,3 +1086,34 @@ RUNDOWNS_TIMEZONE = DEFAULT_TIMEZONE
 #: .. versionadded:: 2.6
 #:
 REBUILD_ELASTIC_ON_INIT_DATA_ERROR = strtobool(env("REBUILD_ELASTIC_ON_INIT_DATA_ERROR", "false"))
+
+
+#: Cache compiled jinja templates on disk so these can be reused by other workers
+#:
+#: .. versionadded:: 2.7
+#:
+JINJA_BYTECODE_CACHE = strtobool(env("JINJA_BYTECODE_CACHE", "true"))
+
+#: Jinja bytecode cache directory, will use system temp dir if not set
+#:
+#: .. versionadded:: 2.7
+#:
+JINJA_BYTECODE_CACHE_DIR = env("JINJA_BYTECODE_CACHE_DIR")
+
+#: Build mongo indexes in background
+#:
+#: By default it's only used for mongo < 4.2, where the option is not ignored.
+#: Set to ``false`` when using a database which does not support it, like Amazon DocumentDB.
+#:
+#: .. versionadded:: 2.7
+#:
+MONGO_INDEX_BACKGROUND = strtobool(env("MONGO_INDEX_BACKGROUND")) if env("MONGO_INDEX_BACKGROUND") else None
+
+#: Import installed apps modules in parallel on app init
+#:
+#: It can make app init faster when there are many apps installed,
+#: but apps with circular imports might fail to import this way.
+#:
+#: .. versionadded:: 2.7
+#:
+PARALLEL_APP_IMPORT = strtobool(env("PARALLEL_APP_IMPORT", "false"))
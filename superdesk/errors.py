@@ -90,11 +90,12 @@ class SuperdeskError(DocumentError):
         desc_text = "" if not self.desc else (" Details: " + self.desc)
         return "{} Error {} - {}{desc}".format(self.__class__.__name__, self.code, self.message, desc=desc_text)
 
-    def to_dict(self):
+    def to_dict(self, **extra):
         return {
             "code": self.code,
             "desc": self.desc,
             "message": self.message,
+            **extra,
         }
 
     def get_error_description(self):
@@ -124,13 +125,17 @@ class SuperdeskApiError(SuperdeskError):
         elif message:
             logger.error("HTTP Exception {} has been raised: {}".format(status_code, message))
 
-    def to_dict(self):
-        """Create dict for json response."""
+    def to_dict(self, **extra):
+        """Create dict for json response.
+
+        :param extra: additional fields to add to the response
+        """
         rv = {}
         rv[app.config["STATUS"]] = app.config["STATUS_ERR"]
         rv["_message"] = self.message or ""
         if hasattr(self, "payload"):
             rv[app.config["ISSUES"]] = self.payload
+        rv.update(extra)
         return rv
 
     def __str__(self):
@@ -9,13 +9,19 @@
 # AUTHORS and LICENSE files distributed with this source code, or
 # at https://www.sourcefabric.org/superdesk/license
 
-from typing import Dict, Any, Type
+from types import ModuleType
+from typing import Callable, Dict, Any, List, Optional, Tuple, Type
+from concurrent.futures import ThreadPoolExecutor
 
 import os
+import re
 import eve
+import functools
 import flask
 import jinja2
+import time
 import importlib
+import itertools
 import superdesk
 import logging
 
@@ -27,7 +33,8 @@ from eve.render import send_response
 from flask_babel import Babel
 from flask import g, json
 from babel import parse_locale
-from pymongo.errors import DuplicateKeyError
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
 
 from superdesk.celery_app import init_celery
 from superdesk.datalayer import SuperdeskDataLayer  # noqa
@@ -37,12 +44,28 @@ from superdesk.logging import configure_logging
 from superdesk.storage import ProxyMediaStorage
 from superdesk.validator import SuperdeskValidator
 from superdesk.json_utils import SuperdeskJSONEncoder
-from .elastic_apm import setup_apm
 
 SUPERDESK_PATH = os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
 logger = logging.getLogger(__name__)
 
+#: response mimetypes which might contain media urls
+TEXT_MIMETYPES_PREFIXES = ("text/", "application/json", "application/xml")
+TEXT_MIMETYPES_SUFFIXES = ("+json", "+xml")
+
+FORBIDDEN_ERROR_TEMPLATE = {"code": 403, "error": None}
+ASSERT_ERROR_TEMPLATE = {"code": 400, "error": None}
+
+
+def _load_default_settings() -> Dict[str, Any]:
+    """Get uppercase attributes of ``superdesk.default_settings``, same as ``Config.from_object`` would."""
+    default_settings = importlib.import_module("superdesk.default_settings")
+    return {key: getattr(default_settings, key) for key in dir(default_settings) if key.isupper()}
+
+
+#: snapshot of default settings so it's not computed for every new app
+DEFAULT_SETTINGS = _load_default_settings()
+
 
 def set_error_handlers(app):
     """Set error handlers for the given application object.
@@ -56,18 +79,21 @@ def set_error_handlers(app):
 
     @app.errorhandler(SuperdeskError)
     def client_error_handler(error):
-        error_dict = error.to_dict()
-        error_dict.update(internal_error=error.status_code)
+        error_dict = error.to_dict(internal_error=error.status_code)
         status_code = error.status_code or 422
         return send_response(None, (error_dict, None, None, status_code))
 
     @app.errorhandler(403)
     def server_forbidden_handler(error):
-        return send_response(None, ({"code": 403, "error": error.response}, None, None, 403))
+        response = FORBIDDEN_ERROR_TEMPLATE.copy()
+        response["error"] = error.response
+        return send_response(None, (response, None, None, 403))
 
     @app.errorhandler(AssertionError)
     def assert_error_handler(error):
-        return send_response(None, ({"code": 400, "error": str(error) if str(error) else "assert"}, None, None, 400))
+        response = ASSERT_ERROR_TEMPLATE.copy()
+        response["error"] = str(error) or "assert"
+        return send_response(None, (response, None, None, 400))
 
     @app.errorhandler(500)
     def server_error_handler(error):
@@ -77,30 +103,51 @@ def set_error_handlers(app):
 
 
 class SuperdeskEve(eve.Eve):
-    def __init__(self, **kwargs):
-        # set attributes to avoid event slots being created
-        # when getattr is called on those, thx to eve
-        self.apm = None
-        self.babel_tzinfo = None
-        self.babel_locale = None
-        self.babel_translations = None
-        self.notification_client = None
+    # set attributes to avoid event slots being created
+    # when getattr is called on those, thx to eve
+    apm = None
+    babel_tzinfo = None
+    babel_locale = None
+    babel_translations = None
+    notification_client = None
+
+    _mongo_version = None
+    _mail = None
 
-        super().__init__(**kwargs)
+    #: attributes which should not create event slots
+    _MISSING_ATTRS = frozenset(("im_self", "im_func"))
 
     def __getattr__(self, name):
         """Workaround for https://github.com/pyeve/eve/issues/1087"""
-        if name in {"im_self", "im_func"}:
+        if name in self._MISSING_ATTRS:
             raise AttributeError("type object '%s' has no attribute '%s'" % (self.__class__.__name__, name))
         return super(SuperdeskEve, self).__getattr__(name)
 
+    @property
+    def mail(self):
+        """Flask-Mail instance, initialized on first use."""
+        if self._mail is None:
+            self._mail = Mail(self)
+        return self._mail
+
+    @mail.setter
+    def mail(self, mail):
+        self._mail = mail
+
     def init_indexes(self, ignore_duplicate_keys=False):
+        background = self.config.get("MONGO_INDEX_BACKGROUND")
+
         for resource, resource_config in self.config["DOMAIN"].items():
             mongo_indexes = resource_config.get("mongo_indexes__init")
             if not mongo_indexes:
                 continue
 
+            if background is None:
+                # background option is ignored since mongo 4.2
+                background = self.get_mongo_version() < (4, 2)
+
             # Borrowed https://github.com/pyeve/eve/blob/22ea4bfebc8b633251cd06837893ff699bd07a00/eve/flaskapp.py#L915
+            indexes = []
             for name, value in mongo_indexes.items():
                 if isinstance(value, tuple):
                     list_of_keys, index_options = value
@@ -108,34 +155,73 @@ class SuperdeskEve(eve.Eve):
                     list_of_keys = value
                     index_options = {}
 
-                # index creation in background
-                index_options.setdefault("background", True)
+                # index creation in background, copy options so resource config is not modified
+                if background:
+                    index_options = {"background": True, **index_options}
 
-                try:
-                    create_index(self, resource, name, list_of_keys, index_options)
-                except KeyError:
-                    logger.warning("resource config missing for %s", resource)
-                    continue
-                except DuplicateKeyError as err:
-                    # Duplicate key for unique indexes are generally caused by invalid documents in the collection
-                    # such as multiple documents not having a value for the attribute used for the index
-                    # Log the error so it can be diagnosed and fixed
-                    logger.exception(err)
+                indexes.append((name, list_of_keys, index_options))
 
-                    if not ignore_duplicate_keys:
-                        raise
+            try:
+                self._create_indexes(resource, indexes)
+            except KeyError:
+                logger.warning("resource config missing for %s", resource)
+                continue
+            except OperationFailure:
+                # create indexes one by one to find out which one is failing
+                # and to drop & recreate indexes with changed definition
+                self._create_indexes_one_by_one(resource, indexes, ignore_duplicate_keys)
+
+    def get_mongo_version(self):
+        """Get mongo server version as tuple, it's cached after first call."""
+        if self._mongo_version is None:
+            with self.app_context():
+                build_info = self.data.pymongo().db.command("buildInfo")
+            self._mongo_version = tuple(build_info["versionArray"])
+        return self._mongo_version
+
+    def _create_indexes(self, resource, indexes):
+        """Create all indexes for given resource using single command per collection."""
+        collection = self.config["SOURCES"][resource]["source"]
+        prefix = self.config["DOMAIN"][resource].get("mongo_prefix", "MONGO")
+
+        with self.app_context():
+            db = self.data.pymongo(resource, prefix).db
+
+        models = [IndexModel(list_of_keys, name=name, **index_options) for name, list_of_keys, index_options in indexes]
+
+        collections = [db[collection]]
+        if self.config["DOMAIN"][resource]["versioning"]:
+            collections.append(db[collection + self.config["VERSIONS"]])
+
+        for coll in collections:
+            coll.create_indexes(models)
+
+    def _create_indexes_one_by_one(self, resource, indexes, ignore_duplicate_keys=False):
+        for name, list_of_keys, index_options in indexes:
+            try:
+                create_index(self, resource, name, list_of_keys, index_options)
+            except DuplicateKeyError as err:
+                # Duplicate key for unique indexes are generally caused by invalid documents in the collection
+                # such as multiple documents not having a value for the attribute used for the index
+                # Log the error so it can be diagnosed and fixed
+                logger.exception(err)
+
+                if not ignore_duplicate_keys:
+                    raise
 
     def item_scope(self, name, schema=None):
         """Register item scope."""
-        self.config.setdefault("item_scope", {})[name] = {
+        scopes = self.config.setdefault("item_scope", {})
+        if name in scopes:
+            raise ValueError("Item scope {} is already registered".format(name))
+        scopes[name] = {
             "schema": schema,
         }
 
         def update_resource_schema(resource):
             assert schema
             self.config["DOMAIN"][resource]["schema"].update(schema)
-            for key in schema:
-                self.config["DOMAIN"][resource]["datasource"]["projection"][key] = 1
+            self.config["DOMAIN"][resource]["datasource"]["projection"].update(dict.fromkeys(schema, 1))
 
         if schema is not None:
             for resource in ("archive", "archive_autosave", "published", "archived"):
@@ -145,32 +231,92 @@ class SuperdeskEve(eve.Eve):
                     update_resource_schema(versioned_resource)
 
 
+@functools.lru_cache(maxsize=256)
+def get_locale_name(language: str, default_language: str = "en") -> str:
+    """Get babel locale name for given language, fallback to default language if it's not valid."""
+    locale_name = language.replace("-", "_")
+    try:
+        # Attempt to load the local using Babel.parse_local
+        parse_locale(locale_name)
+    except ValueError:
+        # If Babel fails to recognise the locale, then use the default language
+        locale_name = default_language.replace("-", "_")
+    return locale_name
+
+
+def is_text_mimetype(mimetype: Optional[str]) -> bool:
+    if not mimetype:
+        return False
+    return mimetype.startswith(TEXT_MIMETYPES_PREFIXES) or mimetype.endswith(TEXT_MIMETYPES_SUFFIXES)
+
+
+@functools.lru_cache(maxsize=8)
+def get_media_prefixes_fixer(current_prefix: str, prefixes: Tuple[str, ...]) -> Callable[[bytes], bytes]:
+    """Get function which replaces all given prefixes with current prefix using single pass."""
+    current = current_prefix.rstrip("/").encode()
+    encoded_prefixes = sorted((prefix.rstrip("/").encode() for prefix in prefixes), key=len, reverse=True)
+    regex = re.compile(b"|".join(re.escape(prefix) for prefix in encoded_prefixes))
+
+    def fix_media_prefixes(data: bytes) -> bytes:
+        return regex.sub(lambda match: current, data)
+
+    return fix_media_prefixes
+
+
+def _import_module(module_name: str) -> ModuleType:
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    logger.debug("imported %s in %.3fs", module_name, time.perf_counter() - start)
+    return module
+
+
+def import_modules(module_names: List[str], parallel: bool = False) -> List[ModuleType]:
+    """Import modules in given order, optionally using a thread pool to overlap I/O.
+
+    In case parallel import fails it tries again serially, so the original error is raised.
+    It also covers import deadlocks and partially initialized modules caused by circular imports.
+    """
+    if parallel:
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                return list(executor.map(_import_module, module_names))
+        except Exception as err:
+            logger.warning("parallel import failed, falling back to serial import: %s", err)
+    return [_import_module(module_name) for module_name in module_names]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_media_storage_provider(provider: str) -> Type[MediaStorage]:
+    module_name, class_name = provider.rsplit(".", 1)
+    module = importlib.import_module(module_name)
+    klass = getattr(module, class_name)
+    if not issubclass(klass, MediaStorage):
+        raise SystemExit("Invalid setting MEDIA_STORAGE_PROVIDER. Class must extend eve.io.media.MediaStorage")
+    return klass
+
+
 def get_media_storage_class(app_config: Dict[str, Any], use_provider_config: bool = True) -> Type[MediaStorage]:
     if use_provider_config and app_config.get("MEDIA_STORAGE_PROVIDER"):
         if isinstance(app_config["MEDIA_STORAGE_PROVIDER"], str):
-            module_name, class_name = app_config["MEDIA_STORAGE_PROVIDER"].rsplit(".", 1)
-            module = importlib.import_module(module_name)
-            klass = getattr(module, class_name)
-            if not issubclass(klass, MediaStorage):
-                raise SystemExit("Invalid setting MEDIA_STORAGE_PROVIDER. Class must extend eve.io.media.MediaStorage")
-            return klass
+            return _get_media_storage_provider(app_config["MEDIA_STORAGE_PROVIDER"])
 
     return ProxyMediaStorage
 
 
-def get_app(config=None, media_storage=None, config_object=None, init_elastic=None):
+def get_app(config=None, media_storage=None, config_object=None, init_elastic=None, minimal=False):
     """App factory.
 
     :param config: configuration that can override config from ``default_settings.py``
     :param media_storage: media storage class to use
     :param config_object: config object to load (can be module name, module or an object)
     :param init_elastic: obsolete config - kept there for BC
+    :param minimal: skip installing ``CORE_APPS`` and ``INSTALLED_APPS``
     :return: a new SuperdeskEve app instance
     """
 
     abs_path = SUPERDESK_PATH
     app_config = flask.Config(abs_path)
-    app_config.from_object("superdesk.default_settings")
+    app_config.update(DEFAULT_SETTINGS)
     app_config.setdefault("APP_ABSPATH", abs_path)
     app_config.setdefault("DOMAIN", {})
     app_config.setdefault("SOURCES", {})
@@ -196,6 +342,7 @@ def get_app(config=None, media_storage=None, config_object=None, init_elastic=No
         template_folder=os.path.join(abs_path, "templates"),
     )
 
+    # jinja_options must be set before jinja_env is created, it's created on first access
     app.jinja_options = {"autoescape": False}
     app.json_encoder = SuperdeskJSONEncoder  # seems like eve param doesn't set it on flask
 
@@ -215,9 +362,19 @@ def get_app(config=None, media_storage=None, config_object=None, init_elastic=No
     )
 
     app.jinja_loader = custom_loader
-    app.mail = Mail(app)
+
+    if app.config.get("JINJA_BYTECODE_CACHE"):
+        app.jinja_env.bytecode_cache = jinja2.FileSystemBytecodeCache(
+            directory=app.config.get("JINJA_BYTECODE_CACHE_DIR"),
+            pattern="__superdesk_jinja2_%s.cache",
+        )
+
     app.sentry = SuperdeskSentry(app)
-    setup_apm(app)
+
+    if app.config.get("APM_SERVER_URL"):
+        from .elastic_apm import setup_apm
+
+        setup_apm(app)
 
     # setup babel
     app.config.setdefault("BABEL_TRANSLATION_DIRECTORIES", os.path.join(SUPERDESK_PATH, "translations"))
@@ -226,51 +383,47 @@ def get_app(config=None, media_storage=None, config_object=None, init_elastic=No
     @babel.localeselector
     def get_locale():
         user = getattr(g, "user", {})
-        user_language = user.get("language", app.config.get("DEFAULT_LANGUAGE", "en"))
-        try:
-            # Attempt to load the local using Babel.parse_local
-            parse_locale(user_language.replace("-", "_"))
-        except ValueError:
-            # If Babel fails to recognise the locale, then use the default language
-            user_language = app.config.get("DEFAULT_LANGUAGE", "en")
-
-        return user_language.replace("-", "_")
+        default_language = app.config.get("DEFAULT_LANGUAGE", "en")
+        return get_locale_name(user.get("language", default_language), default_language)
 
     set_error_handlers(app)
 
     @app.after_request
     def after_request(response):
         # fixing previous media prefixes if defined
-        if app.config["MEDIA_PREFIXES_TO_FIX"] and app.config["MEDIA_PREFIX"]:
-            current_prefix = app.config["MEDIA_PREFIX"].rstrip("/").encode()
-            for prefix in app.config["MEDIA_PREFIXES_TO_FIX"]:
-                response.data = response.data.replace(prefix.rstrip("/").encode(), current_prefix)
+        prefixes = app.config["MEDIA_PREFIXES_TO_FIX"]
+        current_prefix = app.config["MEDIA_PREFIX"]
+        if prefixes and current_prefix:
+            if response.direct_passthrough or response.is_streamed or not is_text_mimetype(response.mimetype):
+                return response
+            fix_media_prefixes = get_media_prefixes_fixer(current_prefix, tuple(prefixes))
+            response.data = fix_media_prefixes(response.data)
         return response
 
     init_celery(app)
-    installed = set()
+    app.installed_apps = []
 
-    def install_app(module_name):
-        if module_name in installed:
-            return
-        installed.add(module_name)
-        app_module = importlib.import_module(module_name)
-        if hasattr(app_module, "init_app"):
-            app_module.init_app(app)
+    if not minimal:
+        # core apps first, skip duplicates but keep the order
+        app.installed_apps = list(
+            dict.fromkeys(itertools.chain(app.config.get("CORE_APPS", []), app.config.get("INSTALLED_APPS", [])))
+        )
 
-    for module_name in app.config.get("CORE_APPS", []):
-        install_app(module_name)
+    init_app_callbacks = []
+    for app_module in import_modules(app.installed_apps, parallel=app.config.get("PARALLEL_APP_IMPORT", False)):
+        if hasattr(app_module, "init_app"):
+            init_app_callbacks.append(app_module.init_app)
 
-    for module_name in app.config.get("INSTALLED_APPS", []):
-        install_app(module_name)
+    for init_app in init_app_callbacks:
+        init_app(app)
 
     app.config.setdefault("DOMAIN", {})
-    for resource in superdesk.DOMAIN:
-        if resource not in app.config["DOMAIN"]:
-            app.register_resource(resource, superdesk.DOMAIN[resource])
+    registered = app.config["DOMAIN"].keys()
+    missing = [(name, resource_config) for name, resource_config in superdesk.DOMAIN.items() if name not in registered]
+    for resource, resource_config in missing:
+        app.register_resource(resource, resource_config)
 
-    for name, jinja_filter in superdesk.JINJA_FILTERS.items():
-        app.jinja_env.filters[name] = jinja_filter
+    app.jinja_env.filters.update(superdesk.JINJA_FILTERS)
 
     configure_logging(app.config["LOG_CONFIG_FILE"])
 
@@ -1,6 +1,4 @@
 import logging
-from raven.contrib.flask import Sentry
-from raven.contrib.celery import register_signal, register_logger_signal
 
 
 SENTRY_DSN = "SENTRY_DSN"
@@ -11,6 +9,9 @@ class SuperdeskSentry:
 
     def __init__(self, app):
         if app.config.get(SENTRY_DSN):
+            from raven.contrib.flask import Sentry
+            from raven.contrib.celery import register_signal, register_logger_signal
+
             if "verify_ssl" not in app.config[SENTRY_DSN]:
                 app.config[SENTRY_DSN] += "?verify_ssl=0"
             app.config.setdefault("SENTRY_NAME", app.config.get("SERVER_DOMAIN"))
@@ -25,6 +25,10 @@ logging.getLogger("superdesk").setLevel(logging.INFO)
 logging.getLogger("content_api").setLevel(logging.INFO)
 logging.getLogger("superdesk.websockets_comms").setLevel(logging.WARNING)
 
+#: last configured logging file and handlers it has set
+_configured_file_path = None
+_configured_handlers = {}
+
 
 def item_msg(msg, item):
     """Return a message with item id appended.
@@ -35,19 +39,33 @@ def item_msg(msg, item):
     return "{} item={}".format(msg, str(item.get("_id", item.get("guid"))))
 
 
+def _get_handlers(logger_names):
+    return {name: list(logging.getLogger(name or None).handlers) for name in logger_names}
+
+
 def configure_logging(file_path):
     """
     Configure logging.
 
+    Logging is not reloaded for every new app if it's configured using same file
+    and handlers were not changed since, eg. by celery.
+
     :param str file_path:
     """
+    global _configured_file_path, _configured_handlers
+
     if not file_path:
         return
 
+    if file_path == _configured_file_path and _get_handlers(_configured_handlers) == _configured_handlers:
+        return
+
     try:
         with open(file_path, "r") as f:
             logging_dict = yaml.load(f, Loader=yaml.SafeLoader)
 
         logging.config.dictConfig(logging_dict)
+        _configured_file_path = file_path
+        _configured_handlers = _get_handlers([""] + list(logging_dict.get("loggers") or {}))
     except Exception:
         logger.warn("Cannot load logging config. File: %s", file_path)
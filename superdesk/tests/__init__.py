@@ -24,7 +24,7 @@ from flask import json, Config
 from apps.ldap import ADAuth
 from superdesk import get_resource_service
 from superdesk.factory import get_app
-from superdesk.factory.app import get_media_storage_class
+from superdesk.factory.app import get_media_storage_class, DEFAULT_SETTINGS
 from superdesk.storage.amazon_media_storage import AmazonMediaStorage
 from superdesk.storage.proxy import ProxyMediaStorage
 
@@ -92,7 +92,8 @@ def update_config(conf):
     conf["MACROS_MODULE"] = "superdesk.macros"
     conf["DEFAULT_TIMEZONE"] = "Europe/Prague"
     conf["LEGAL_ARCHIVE"] = True
-    conf["INSTALLED_APPS"].extend(["planning", "superdesk.macros.imperial"])
+    # create new list, default settings values are shared between apps
+    conf["INSTALLED_APPS"] = conf["INSTALLED_APPS"] + ["planning", "superdesk.macros.imperial"]
 
     # limit mongodb connections
     conf["MONGO_CONNECT"] = False
@@ -164,7 +165,7 @@ def drop_mongo(app):
 def setup_config(config):
     app_abspath = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
     app_config = Config(app_abspath)
-    app_config.from_object("superdesk.default_settings")
+    app_config.update(DEFAULT_SETTINGS)
     cwd = Path.cwd()
     for p in [cwd] + list(cwd.parents):
         settings = p / "settings.py"
@@ -182,7 +183,7 @@ def setup_config(config):
     # Extend the INSTALLED APPS with the list provided
     if config:
         config.setdefault("INSTALLED_APPS", [])
-        app_config["INSTALLED_APPS"].extend(config.pop("INSTALLED_APPS", []))
+        app_config["INSTALLED_APPS"] = app_config["INSTALLED_APPS"] + config.pop("INSTALLED_APPS", [])
 
     # Make sure there are no duplicate entries in INSTALLED_APPS
     app_config["INSTALLED_APPS"] = list(set(app_config["INSTALLED_APPS"]))
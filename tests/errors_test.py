@@ -82,6 +82,16 @@ class SuperdeskErrorTestCase(unittest.TestCase):
             str(instance), ("SuperdeskError Error 101 - Foobar error " "Details: This is a detailed description")
         )
 
+    def test_to_dict_with_extra_fields(self):
+        klass = self._get_target_class()
+        instance = klass(1234, desc="Detailed error description.")
+        instance.message = "Foobar error"
+
+        self.assertEqual(
+            instance.to_dict(internal_error=400),
+            {"code": 1234, "desc": "Detailed error description.", "message": "Foobar error", "internal_error": 400},
+        )
+
 
 class ErrorsTestCase(TestCase):
     mock_logger_handler = {}
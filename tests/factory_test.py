@@ -0,0 +1,273 @@
+import flask
+import threading
+import unittest
+
+from collections import defaultdict
+from unittest import mock
+from jinja2 import FileSystemBytecodeCache
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from superdesk.tests import setup_config
+from superdesk.factory.app import (
+    DEFAULT_SETTINGS,
+    SuperdeskEve,
+    get_app,
+    get_locale_name,
+    get_media_prefixes_fixer,
+    is_text_mimetype,
+    import_modules,
+)
+
+
+class FactoryTestCase(unittest.TestCase):
+    def test_get_locale_name(self):
+        self.assertEqual("en", get_locale_name("en"))
+        self.assertEqual("en_US", get_locale_name("en-US"))
+        self.assertEqual("cs", get_locale_name("foo bar", "cs"))
+        self.assertEqual("pt_BR", get_locale_name("", "pt-BR"))
+
+    def test_media_prefixes_fixer(self):
+        fix = get_media_prefixes_fixer("http://new/", ("http://old/", "https://older"))
+        self.assertEqual(
+            b'{"a": "http://new/foo", "b": "http://new/bar", "c": "http://other/baz"}',
+            fix(b'{"a": "http://old/foo", "b": "https://older/bar", "c": "http://other/baz"}'),
+        )
+
+    def test_is_text_mimetype(self):
+        self.assertTrue(is_text_mimetype("application/json"))
+        self.assertTrue(is_text_mimetype("text/html"))
+        self.assertTrue(is_text_mimetype("application/vnd.api+json"))
+        self.assertFalse(is_text_mimetype("image/jpeg"))
+        self.assertFalse(is_text_mimetype("application/octet-stream"))
+        self.assertFalse(is_text_mimetype(None))
+
+    def test_app_attributes_are_not_event_slots(self):
+        app = get_app(minimal=True)
+        self.assertIsNone(getattr(app, "im_self", None))
+        self.assertIsNone(getattr(app, "im_func", None))
+        for name in ("apm", "babel_tzinfo", "babel_locale", "babel_translations", "notification_client"):
+            self.assertIsNone(getattr(app, name))
+            self.assertNotIn(name, app.__dict__)
+        with mock.patch.object(SuperdeskEve, "_MISSING_ATTRS", frozenset(["foo"])):
+            self.assertIsNone(getattr(app, "foo", None))
+            self.assertNotIn("foo", app.__dict__)
+
+    def test_import_modules(self):
+        module_names = ["module_{}".format(i) for i in range(20)]
+        for parallel in (False, True):
+            with mock.patch("superdesk.factory.app.importlib") as importlib_mock:
+                importlib_mock.import_module.side_effect = lambda name: "imported " + name
+                modules = import_modules(module_names, parallel=parallel)
+            self.assertEqual(["imported " + name for name in module_names], modules)
+
+    def test_import_modules_parallel_fallback(self):
+        module_names = ["module_{}".format(i) for i in range(20)]
+        lock = threading.Lock()
+        failed = []
+
+        def import_module(name):
+            with lock:
+                if not failed:
+                    failed.append(name)
+                    raise RuntimeError("deadlock detected")
+            return "imported " + name
+
+        with mock.patch("superdesk.factory.app.importlib") as importlib_mock:
+            importlib_mock.import_module.side_effect = import_module
+            modules = import_modules(module_names, parallel=True)
+
+        self.assertEqual(["imported " + name for name in module_names], modules)
+        serial_calls = importlib_mock.import_module.call_args_list[-len(module_names) :]
+        self.assertEqual([mock.call(name) for name in module_names], serial_calls)
+
+    def test_import_modules_parallel_fallback_raises_original_error(self):
+        with mock.patch("superdesk.factory.app.importlib") as importlib_mock:
+            importlib_mock.import_module.side_effect = ImportError("missing")
+            with self.assertRaises(ImportError):
+                import_modules(["missing"], parallel=True)
+            self.assertEqual(2, importlib_mock.import_module.call_count)
+
+    def test_setup_config_does_not_modify_default_settings(self):
+        installed_apps = list(DEFAULT_SETTINGS["INSTALLED_APPS"])
+        config = setup_config({"INSTALLED_APPS": ["foo"]})
+        self.assertIn("foo", config["INSTALLED_APPS"])
+        self.assertEqual(installed_apps, DEFAULT_SETTINGS["INSTALLED_APPS"])
+
+    def test_after_request_fixes_media_prefixes(self):
+        app = get_app(minimal=True, config={"MEDIA_PREFIX": "http://new", "MEDIA_PREFIXES_TO_FIX": ["http://old"]})
+
+        def stream():
+            yield b'{"href": "http://old/foo"}'
+
+        with app.test_request_context():
+            response = app.process_response(flask.Response('{"href": "http://old/foo"}', mimetype="application/json"))
+            self.assertEqual(b'{"href": "http://new/foo"}', response.data)
+
+            response = app.process_response(flask.Response(b"http://old/foo", mimetype="image/jpeg"))
+            self.assertEqual(b"http://old/foo", response.data)
+
+            generator = stream()
+            response = app.process_response(flask.Response(generator, mimetype="application/json"))
+            self.assertTrue(response.is_streamed)
+            self.assertIs(generator, response.response)
+
+            response = flask.Response(generator, mimetype="application/json", direct_passthrough=True)
+            response = app.process_response(response)
+            self.assertIs(generator, response.response)
+
+    def test_item_scope(self):
+        app = get_app(minimal=True)
+        resources = ("archive", "archive_autosave", "published", "archived", "archive_versions")
+        app.config["DOMAIN"] = {
+            resource: {"schema": {"headline": {}}, "datasource": {"projection": {"headline": 1}}}
+            for resource in resources
+        }
+        schema = {"foo": {"type": "string"}, "bar": {"type": "dict"}}
+
+        app.item_scope("test", schema)
+
+        self.assertEqual({"schema": schema}, app.config["item_scope"]["test"])
+        for resource in resources:
+            self.assertEqual(
+                {"headline": 1, "foo": 1, "bar": 1}, app.config["DOMAIN"][resource]["datasource"]["projection"]
+            )
+            self.assertEqual({"headline": {}, **schema}, app.config["DOMAIN"][resource]["schema"])
+
+        with self.assertRaises(ValueError):
+            app.item_scope("test", {"baz": {"type": "string"}})
+        self.assertNotIn("baz", app.config["DOMAIN"]["archive"]["datasource"]["projection"])
+
+    def test_mail_is_created_on_first_use(self):
+        app = get_app(minimal=True)
+        self.assertNotIn("mail", app.extensions)
+        mail = app.mail
+        self.assertIn("mail", app.extensions)
+        self.assertIs(mail, app.mail)
+
+        mock_mail = mock.Mock()
+        app.mail = mock_mail
+        self.assertIs(mock_mail, app.mail)
+
+    def test_jinja_env(self):
+        app = get_app(minimal=True, config={"DEBUG": False})
+        self.assertIsInstance(app.jinja_env.bytecode_cache, FileSystemBytecodeCache)
+        self.assertFalse(app.jinja_env.autoescape)
+        self.assertFalse(app.jinja_env.auto_reload)
+
+        app = get_app(minimal=True, config={"DEBUG": True, "JINJA_BYTECODE_CACHE": False})
+        self.assertIsNone(app.jinja_env.bytecode_cache)
+        self.assertFalse(app.jinja_env.autoescape)
+        self.assertTrue(app.jinja_env.auto_reload)
+
+        app = get_app(minimal=True, config={"DEBUG": False, "TEMPLATES_AUTO_RELOAD": True})
+        self.assertTrue(app.jinja_env.auto_reload)
+
+
+class InitIndexesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = get_app(minimal=True, config={"MONGO_INDEX_BACKGROUND": False})
+        self.app.config["DOMAIN"] = {
+            "items": {
+                "versioning": True,
+                "mongo_indexes__init": {
+                    "guid_1": ([("guid", 1)], {"unique": True}),
+                    "state_1": [("state", 1)],
+                },
+            },
+            "users": {
+                "versioning": False,
+                "mongo_indexes__init": {"username_1": [("username", 1)]},
+            },
+            "other": {"versioning": False},
+        }
+        self.app.config["SOURCES"] = {
+            "items": {"source": "items"},
+            "users": {"source": "users"},
+            "other": {"source": "other"},
+        }
+
+        self.collections = defaultdict(mock.MagicMock)
+        db = mock.MagicMock()
+        db.__getitem__.side_effect = self.collections.__getitem__
+        patcher = mock.patch.object(self.app.data, "pymongo", return_value=mock.Mock(db=db))
+        self.pymongo = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_created_indexes(self, collection):
+        self.assertEqual(1, self.collections[collection].create_indexes.call_count)
+        models = self.collections[collection].create_indexes.call_args[0][0]
+        return {model.document["name"]: model.document for model in models}
+
+    def test_create_indexes_per_collection(self):
+        self.app.init_indexes()
+
+        for collection in ("items", "items_versions"):
+            indexes = self.get_created_indexes(collection)
+            self.assertEqual(["guid_1", "state_1"], list(indexes.keys()))
+            self.assertEqual({"guid": 1}, indexes["guid_1"]["key"])
+            self.assertTrue(indexes["guid_1"]["unique"])
+            self.assertNotIn("background", indexes["state_1"])
+
+        self.assertEqual(["username_1"], list(self.get_created_indexes("users").keys()))
+        self.assertNotIn("users_versions", self.collections)
+        self.assertNotIn("other", self.collections)
+
+    @mock.patch("superdesk.factory.app.create_index")
+    def test_create_indexes_fallback(self, create_index):
+        self.collections["items"].create_indexes.side_effect = OperationFailure("conflict", 85)
+
+        self.app.init_indexes()
+
+        create_index.assert_has_calls(
+            [
+                mock.call(self.app, "items", "guid_1", [("guid", 1)], {"unique": True}),
+                mock.call(self.app, "items", "state_1", [("state", 1)], {}),
+            ]
+        )
+        self.assertEqual(2, create_index.call_count)
+        self.assertEqual(1, self.collections["users"].create_indexes.call_count)
+
+    @mock.patch("superdesk.factory.app.create_index")
+    def test_create_indexes_duplicate_keys(self, create_index):
+        self.collections["items"].create_indexes.side_effect = DuplicateKeyError("duplicate", 11000)
+        create_index.side_effect = DuplicateKeyError("duplicate", 11000)
+
+        with self.assertRaises(DuplicateKeyError):
+            self.app.init_indexes()
+        self.assertEqual(1, create_index.call_count)
+
+        create_index.reset_mock()
+        self.app.init_indexes(ignore_duplicate_keys=True)
+        self.assertEqual(2, create_index.call_count)
+        self.assertEqual(1, self.collections["users"].create_indexes.call_count)
+
+    def test_background_index_config(self):
+        self.app.config["MONGO_INDEX_BACKGROUND"] = True
+        self.app.init_indexes()
+        self.assertTrue(self.get_created_indexes("users")["username_1"]["background"])
+
+    def test_background_index_config_disabled(self):
+        self.app.config["MONGO_INDEX_BACKGROUND"] = False
+        with mock.patch.object(self.app, "get_mongo_version") as get_mongo_version:
+            self.app.init_indexes()
+        get_mongo_version.assert_not_called()
+        self.assertNotIn("background", self.get_created_indexes("users")["username_1"])
+
+    def test_background_index_by_mongo_version(self):
+        self.app.config["MONGO_INDEX_BACKGROUND"] = None
+        for version, background in (((4, 0, 28, 0), True), ((4, 2, 0, 0), False), ((5, 0, 1, 0), False)):
+            self.collections.clear()
+            self.app._mongo_version = None
+            db = self.pymongo.return_value.db
+            db.command.return_value = {"versionArray": list(version)}
+            self.app.init_indexes()
+            db.command.assert_called_with("buildInfo")
+            self.assertEqual(version, self.app.get_mongo_version())
+            self.assertEqual(background, self.get_created_indexes("items")["guid_1"].get("background", False))
+
+    def test_mongo_version_not_fetched_without_indexes(self):
+        self.app.config["MONGO_INDEX_BACKGROUND"] = None
+        self.app.config["DOMAIN"] = {"other": {"versioning": False}}
+        with mock.patch.object(self.app, "get_mongo_version") as get_mongo_version:
+            self.app.init_indexes()
+        get_mongo_version.assert_not_called()
@@ -0,0 +1,57 @@
+import os
+import logging
+import tempfile
+import unittest
+
+from unittest import mock
+
+import superdesk.logging
+from superdesk.logging import configure_logging
+
+
+LOGGING_CONFIG = """
+version: 1
+disable_existing_loggers: false
+handlers:
+  test:
+    class: logging.NullHandler
+loggers:
+  superdesk.logging_test:
+    handlers: [test]
+"""
+
+
+class ConfigureLoggingTestCase(unittest.TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".yml", delete=False) as f:
+            f.write(LOGGING_CONFIG)
+        self.file_path = f.name
+        self.addCleanup(os.remove, self.file_path)
+
+        self.logger = logging.getLogger("superdesk.logging_test")
+        self.addCleanup(setattr, self.logger, "handlers", [])
+
+        for name, value in (("_configured_file_path", None), ("_configured_handlers", {})):
+            patcher = mock.patch.object(superdesk.logging, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_configure_logging_once(self):
+        with mock.patch("logging.config.dictConfig", wraps=logging.config.dictConfig) as dict_config:
+            configure_logging(self.file_path)
+            configure_logging(self.file_path)
+        self.assertEqual(1, dict_config.call_count)
+        self.assertEqual(1, len(self.logger.handlers))
+
+    def test_configure_logging_when_handlers_changed(self):
+        configure_logging(self.file_path)
+        self.logger.handlers = []
+
+        configure_logging(self.file_path)
+        self.assertEqual(1, len(self.logger.handlers))
+
+    def test_configure_logging_missing_file(self):
+        with mock.patch("logging.config.dictConfig") as dict_config:
+            configure_logging(None)
+            configure_logging(self.file_path + ".missing")
+        dict_config.assert_not_called()